@@ -4,24 +4,79 @@ OpenRouter Markdown Parser for Blind Voting System
 Parses exported OpenRouter markdown files and stores them in Supabase
 """
 
-import re
 import uuid
 import random
-from typing import List, Dict, Tuple, Optional
+import itertools
+import mmap
+from typing import List, Dict, Tuple, Optional, Iterator
 from dataclasses import dataclass
 from pathlib import Path
 import argparse
+import logging
 import os
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from supabase import create_client, Client
-from datetime import datetime
-
-@dataclass
+from datetime import datetime, timezone
+
+# Section header lines in OpenRouter markdown exports
+_USER_HEADER = b'**User - --**'
+_ASSISTANT_HEADER = b'**Assistant - --**'
+
+# All 24 possible A/B/C/D orderings, indexed by a single random draw
+_PERMS = tuple(itertools.permutations('ABCD'))
+
+log = logging.getLogger(__name__)
+
+def _decode(raw: bytes) -> str:
+    """Decode a section body, normalizing newlines as text-mode reads would"""
+    return raw.decode('utf-8').replace('\r\n', '\n').replace('\r', '\n')
+
+def _first_line(content: mmap.mmap) -> bytes:
+    """Return the first non-blank line, ending lines at \r as well as \n like text-mode reads"""
+    pos = 0
+    while pos < len(content):
+        end = content.find(b'\n', pos)
+        if end == -1:
+            end = len(content)
+        cr = content.find(b'\r', pos, end)
+        if cr != -1:
+            end = cr
+        line = content[pos:end]
+        if line.strip():
+            return line
+        pos = end + 1
+    return b''
+
+def _iter_sections(content: mmap.mmap) -> Iterator[Tuple[str, str]]:
+    """Yield (type, content) pairs for each **User - --** / **Assistant - --** section,
+    scanning the raw bytes in place and decoding only the section bodies"""
+    section_type = None
+    idx = 0
+    # mmap.find() defaults to the current file position, so always search from 0
+    user_hit = content.find(_USER_HEADER, 0)
+    assistant_hit = content.find(_ASSISTANT_HEADER, 0)
+    while user_hit != -1 or assistant_hit != -1:
+        if assistant_hit == -1 or (user_hit != -1 and user_hit < assistant_hit):
+            hit, end, next_type = user_hit, user_hit + len(_USER_HEADER), "User"
+            user_hit = content.find(_USER_HEADER, end)
+        else:
+            hit, end, next_type = assistant_hit, assistant_hit + len(_ASSISTANT_HEADER), "Assistant"
+            assistant_hit = content.find(_ASSISTANT_HEADER, end)
+
+        if section_type:  # Skip the title section before the first header
+            yield section_type, _decode(content[idx:hit])
+        section_type = next_type
+        idx = end
+    if section_type:
+        yield section_type, _decode(content[idx:])
+
+@dataclass(slots=True)
 class Turn:
     """Represents a conversation turn with user prompt and model responses"""
     user_prompt: str
     responses: List[str]  # 4 responses in order: Gemini, Claude, GPT-4.1, GPT-5
 
-@dataclass
+@dataclass(slots=True)
 class Conversation:
     """Represents a full conversation from OpenRouter"""
     title: str
@@ -39,154 +94,189 @@ class OpenRouterMarkdownParser:
         "openai/gpt-5"
     ]
 
+    # Max rows per insert request, to stay under PostgREST payload limits
+    BATCH_SIZE = 1000
+
     def __init__(self, supabase_url: str, supabase_key: str):
         """Initialize with Supabase credentials"""
         self.supabase: Client = create_client(supabase_url, supabase_key)
 
+        # The PostgREST client (and its pooled HTTP session) is created lazily on first
+        # use; build it once here and insert through it so concurrent workers share
+        # one connection pool
+        self.postgrest = self.supabase.postgrest
+
     def parse_markdown_file(self, file_path: Path) -> Conversation:
         """Parse a single OpenRouter markdown export file"""
-        with open(file_path, 'r', encoding='utf-8') as f:
-            content = f.read()
+        if os.path.getsize(file_path) == 0:  # mmap can't map an empty file
+            return Conversation(title=file_path.stem, turns=[], source_file=str(file_path))
 
-        # Extract title from first line (remove # prefix)
-        lines = content.strip().split('\n')
-        title = lines[0].lstrip('#').strip() if lines else file_path.stem
+        # Map the file so sections are scanned in place rather than read into one big string
+        with open(file_path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as content:
+            # Extract title from first non-blank line (remove # prefix)
+            title = _first_line(content).decode('utf-8').strip().lstrip('#').strip() or file_path.stem
 
-        # Split content into sections by **User - --** and **Assistant - --**
-        sections = re.split(r'\*\*(User|Assistant) - --\*\*', content)
+            turns = []
+            current_user_prompt = None
+            current_responses = []
 
-        # Remove title section and empty sections, but keep the first empty entry which might contain the title
-        sections = [s.strip() for s in sections[1:] if s.strip()]  # Skip the title section
-
-        turns = []
-        current_user_prompt = None
-        current_responses = []
-
-        i = 0
-        while i < len(sections):
-            if i % 2 == 0:  # Even indices are section types (User/Assistant)
-                section_type = sections[i]
-            else:  # Odd indices are section content
-                section_content = sections[i]
+            for section_type, section_content in _iter_sections(content):
+                section_content = section_content.strip()
+                if not section_content:
+                    continue
 
                 if section_type == "User":
-                    # Save previous turn if we have one with exactly 4 responses
-                    if current_user_prompt and len(current_responses) == 4:
+                    # Save previous turn, failing fast unless it has exactly 4 responses
+                    if current_user_prompt:
+                        if len(current_responses) != 4:
+                            raise ValueError(f"Turn with prompt {current_user_prompt[:40]!r} has {len(current_responses)} responses, expected 4")
                         turns.append(Turn(current_user_prompt, current_responses))
 
                     # Start new turn
-                    current_user_prompt = section_content.strip()
+                    current_user_prompt = section_content
                     current_responses = []
 
                 elif section_type == "Assistant" and current_user_prompt:
                     # Only collect responses if we have a prompt
-                    current_responses.append(section_content.strip())
-
-            i += 1
+                    current_responses.append(section_content)
 
         # Don't forget the last turn
-        if current_user_prompt and len(current_responses) == 4:
+        if current_user_prompt:
+            if len(current_responses) != 4:
+                raise ValueError(f"Turn with prompt {current_user_prompt[:40]!r} has {len(current_responses)} responses, expected 4")
             turns.append(Turn(current_user_prompt, current_responses))
 
         return Conversation(title=title, turns=turns, source_file=str(file_path))
 
-    def randomize_positions(self, turn_id: str, response_ids: List[str]) -> Dict[str, str]:
-        """Create randomized A/B/C/D position mapping for a turn"""
-        positions = ['A', 'B', 'C', 'D']
-        random.shuffle(positions)
-        return dict(zip(response_ids, positions))
+    def randomize_positions(self) -> Tuple[str, ...]:
+        """Pick a randomized A/B/C/D ordering for a turn's responses, in MODEL_NAMES order"""
+        return _PERMS[random.randrange(len(_PERMS))]
 
-    def store_conversation(self, conversation: Conversation) -> str:
+    def _bulk_insert(self, table: str, rows: List[Dict]) -> List[Dict]:
+        """Insert rows in chunks of BATCH_SIZE and return the inserted records"""
+        inserted = []
+        for start in range(0, len(rows), self.BATCH_SIZE):
+            result = self.postgrest.from_(table).insert(rows[start:start + self.BATCH_SIZE]).execute()
+            inserted.extend(result.data)
+        return inserted
+
+    def store_conversation(self, conversation: Conversation, imported_at: Optional[str] = None) -> str:
         """Store conversation in Supabase and return conversation ID"""
 
         # Insert conversation
-        conv_result = self.supabase.table("conversations").insert({
+        conv_result = self.postgrest.from_("conversations").insert({
             "title": conversation.title,
             "source_file": conversation.source_file,
-            "imported_at": datetime.now().isoformat()
+            "imported_at": imported_at or datetime.now(timezone.utc).isoformat()
         }).execute()
 
         conversation_id = conv_result.data[0]["id"]
-        print(f"Created conversation: {conversation.title} (ID: {conversation_id})")
-
-        # Process each turn
-        for turn_number, turn in enumerate(conversation.turns, 1):
-            # Insert turn
-            turn_result = self.supabase.table("turns").insert({
-                "conversation_id": conversation_id,
-                "turn_number": turn_number,
-                "user_prompt": turn.user_prompt
-            }).execute()
-
-            turn_id = turn_result.data[0]["id"]
-            print(f"  Turn {turn_number}: {turn.user_prompt[:50]}...")
-
-            # Insert responses with model mapping
-            response_ids = []
+        log.info("Created conversation: %s (ID: %s)", conversation.title, conversation_id)
+
+        # Insert all turns in one batch, then map IDs back by turn number
+        turn_rows = [{
+            "conversation_id": conversation_id,
+            "turn_number": turn_number,
+            "user_prompt": turn.user_prompt
+        } for turn_number, turn in enumerate(conversation.turns, 1)]
+
+        inserted_turns = sorted(self._bulk_insert("turns", turn_rows), key=lambda t: t["turn_number"])
+        turn_ids = [t["id"] for t in inserted_turns]
+
+        # Positions only depend on response order, so pick every turn's ordering up front
+        turn_positions = [self.randomize_positions() for _ in conversation.turns]
+
+        if log.isEnabledFor(logging.DEBUG):
+            for turn_number, (turn, positions) in enumerate(zip(conversation.turns, turn_positions), 1):
+                log.debug("  Turn %d: %s...", turn_number, turn.user_prompt[:50])
+                log.debug("    Randomized positions: %s", dict(zip(self.MODEL_NAMES, positions)))
+
+        # Insert all responses with model mapping in one batch
+        response_rows = []
+        for turn_id, turn in zip(turn_ids, conversation.turns):
             for response_order, (model_name, response_text) in enumerate(zip(self.MODEL_NAMES, turn.responses), 1):
-                response_result = self.supabase.table("responses").insert({
+                response_rows.append({
                     "turn_id": turn_id,
                     "model_name": model_name,
                     "response_text": response_text,
                     "response_order": response_order
-                }).execute()
-
-                response_ids.append(response_result.data[0]["id"])
+                })
 
-            # Create randomized position mappings
-            position_mapping = self.randomize_positions(turn_id, response_ids)
+        response_ids_by_turn = {turn_id: [None] * len(self.MODEL_NAMES) for turn_id in turn_ids}
+        for response in self._bulk_insert("responses", response_rows):
+            response_ids_by_turn[response["turn_id"]][response["response_order"] - 1] = response["id"]
 
-            for response_id, position in position_mapping.items():
-                self.supabase.table("response_positions").insert({
-                    "turn_id": turn_id,
-                    "response_id": response_id,
-                    "position": position
-                }).execute()
+        # Attach the precomputed positions to the inserted response IDs and insert them in one batch
+        position_rows = [{
+            "turn_id": turn_id,
+            "response_id": response_id,
+            "position": position
+        } for turn_id, positions in zip(turn_ids, turn_positions)
+            for response_id, position in zip(response_ids_by_turn[turn_id], positions)]
 
-            print(f"    Randomized positions: {dict(zip(self.MODEL_NAMES, [position_mapping[rid] for rid in response_ids]))}")
+        self._bulk_insert("response_positions", position_rows)
 
         return conversation_id
 
-    def process_file(self, file_path: Path) -> str:
+    def process_file(self, file_path: Path, imported_at: Optional[str] = None) -> str:
         """Parse and store a single markdown file"""
-        print(f"\nProcessing: {file_path}")
+        log.info("Processing: %s", file_path)
 
         try:
-            conversation = self.parse_markdown_file(file_path)
-            print(f"Parsed {len(conversation.turns)} turns")
+            try:
+                conversation = self.parse_markdown_file(file_path)
+            except ValueError as e:
+                # Malformed export (or undecodable text); nothing has been inserted yet
+                log.warning("Skipping %s: %s", file_path, e)
+                return None
+
+            log.info("Parsed %d turns from %s", len(conversation.turns), file_path)
 
             if not conversation.turns:
-                print("Warning: No valid turns found in file")
+                log.warning("No valid turns found in %s", file_path)
                 return None
 
-            # Validate that all turns have exactly 4 responses
-            for i, turn in enumerate(conversation.turns, 1):
-                if len(turn.responses) != 4:
-                    print(f"Warning: Turn {i} has {len(turn.responses)} responses, expected 4")
-                    return None
-
-            conversation_id = self.store_conversation(conversation)
-            print(f"Successfully stored conversation with ID: {conversation_id}")
+            conversation_id = self.store_conversation(conversation, imported_at)
+            log.info("Successfully stored conversation with ID: %s", conversation_id)
             return conversation_id
 
         except Exception as e:
-            print(f"Error processing {file_path}: {e}")
+            log.error("Error processing %s: %s", file_path, e)
             return None
 
-    def process_directory(self, directory_path: Path) -> List[str]:
-        """Process all .md files in a directory"""
-        md_files = list(directory_path.glob("*.md"))
-        print(f"Found {len(md_files)} markdown files in {directory_path}")
+    def process_directory(self, directory_path: Path, max_workers: int = 8) -> List[str]:
+        """Process all .md files in a directory, uploading several files concurrently"""
+        with os.scandir(directory_path) as entries:
+            md_files = [Path(entry.path) for entry in entries if entry.name.endswith(".md") and entry.is_file()]
+        log.info("Found %d markdown files in %s", len(md_files), directory_path)
+
+        # Stamp every conversation in this run with the same import time
+        imported_at = datetime.now(timezone.utc).isoformat()
 
         conversation_ids = []
-        for md_file in md_files:
-            conv_id = self.process_file(md_file)
-            if conv_id:
-                conversation_ids.append(conv_id)
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            futures = [executor.submit(self.process_file, md_file, imported_at) for md_file in md_files]
+            try:
+                for future in as_completed(futures):
+                    conv_id = future.result()
+                    if conv_id:
+                        conversation_ids.append(conv_id)
+            except BaseException:
+                # On Ctrl-C, let in-flight files finish but don't start any queued ones
+                executor.shutdown(cancel_futures=True)
+                raise
 
         return conversation_ids
 
 
+def _positive_int(value: str) -> int:
+    """argparse type for options that must be at least 1"""
+    number = int(value)
+    if number < 1:
+        raise argparse.ArgumentTypeError(f"must be at least 1, got {number}")
+    return number
+
+
 def main():
     """Main CLI interface"""
     parser = argparse.ArgumentParser(description="Parse OpenRouter markdown exports for blind voting")
@@ -196,13 +286,20 @@ def main():
                        help="Supabase URL")
     parser.add_argument("--supabase-key",
                        help="Supabase anon key (or set SUPABASE_KEY env var)")
+    parser.add_argument("--workers", type=_positive_int, default=8,
+                       help="Number of files to process concurrently when given a directory")
+    parser.add_argument("-v", "--verbose", action="store_true",
+                       help="Log per-turn details such as prompts and position mappings")
 
     args = parser.parse_args()
 
+    logging.basicConfig(level=logging.DEBUG if args.verbose else logging.INFO,
+                        format="%(asctime)s %(levelname)s %(message)s")
+
     # Get Supabase key from arg or environment
     supabase_key = args.supabase_key or os.getenv("SUPABASE_KEY")
     if not supabase_key:
-        print("Error: Supabase key required. Use --supabase-key or set SUPABASE_KEY env var")
+        log.error("Supabase key required. Use --supabase-key or set SUPABASE_KEY env var")
         return 1
 
     # Initialize parser
@@ -213,12 +310,12 @@ def main():
     if path.is_file():
         parser_instance.process_file(path)
     elif path.is_dir():
-        parser_instance.process_directory(path)
+        parser_instance.process_directory(path, max_workers=args.workers)
     else:
-        print(f"Error: {path} is not a valid file or directory")
+        log.error("%s is not a valid file or directory", path)
         return 1
 
-    print("\nProcessing complete!")
+    log.info("Processing complete!")
     return 0
 
 
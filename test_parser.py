@@ -3,18 +3,66 @@
 Test the OpenRouter markdown parser without Supabase
 """
 
-import re
-from typing import List
+import mmap
+import os
+from typing import List, Tuple, Iterator
 from dataclasses import dataclass
 from pathlib import Path
 
-@dataclass
+# Section header lines in OpenRouter markdown exports
+_USER_HEADER = b'**User - --**'
+_ASSISTANT_HEADER = b'**Assistant - --**'
+
+def _decode(raw: bytes) -> str:
+    """Decode a section body, normalizing newlines as text-mode reads would"""
+    return raw.decode('utf-8').replace('\r\n', '\n').replace('\r', '\n')
+
+def _first_line(content: mmap.mmap) -> bytes:
+    """Return the first non-blank line, ending lines at \r as well as \n like text-mode reads"""
+    pos = 0
+    while pos < len(content):
+        end = content.find(b'\n', pos)
+        if end == -1:
+            end = len(content)
+        cr = content.find(b'\r', pos, end)
+        if cr != -1:
+            end = cr
+        line = content[pos:end]
+        if line.strip():
+            return line
+        pos = end + 1
+    return b''
+
+def _iter_sections(content: mmap.mmap) -> Iterator[Tuple[str, str]]:
+    """Yield (type, content) pairs for each **User - --** / **Assistant - --** section,
+    scanning the raw bytes in place and decoding only the section bodies"""
+    section_type = None
+    idx = 0
+    # mmap.find() defaults to the current file position, so always search from 0
+    user_hit = content.find(_USER_HEADER, 0)
+    assistant_hit = content.find(_ASSISTANT_HEADER, 0)
+    while user_hit != -1 or assistant_hit != -1:
+        if assistant_hit == -1 or (user_hit != -1 and user_hit < assistant_hit):
+            hit, end, next_type = user_hit, user_hit + len(_USER_HEADER), "User"
+            user_hit = content.find(_USER_HEADER, end)
+        else:
+            hit, end, next_type = assistant_hit, assistant_hit + len(_ASSISTANT_HEADER), "Assistant"
+            assistant_hit = content.find(_ASSISTANT_HEADER, end)
+
+        if section_type:  # Skip the title section before the first header
+            yield section_type, _decode(content[idx:hit])
+        section_type = next_type
+        idx = end
+    if section_type:
+        yield section_type, _decode(content[idx:])
+
+@dataclass(slots=True)
 class Turn:
     """Represents a conversation turn with user prompt and model responses"""
     user_prompt: str
     responses: List[str]  # 4 responses in order: Gemini, Claude, GPT-4.1, GPT-5
 
-@dataclass
+@dataclass(slots=True)
 class Conversation:
     """Represents a full conversation from OpenRouter"""
     title: str
@@ -23,18 +71,15 @@ class Conversation:
 
 def parse_markdown_file(file_path: Path) -> Conversation:
     """Parse a single OpenRouter markdown export file"""
-    with open(file_path, 'r', encoding='utf-8') as f:
-        content = f.read()
+    if os.path.getsize(file_path) == 0:  # mmap can't map an empty file
+        return Conversation(title=file_path.stem, turns=[], source_file=str(file_path))
 
-    # Extract title from first line (remove # prefix)
-    lines = content.strip().split('\n')
-    title = lines[0].lstrip('#').strip() if lines else file_path.stem
+    # Map the file so sections are scanned in place rather than read into one big string
+    with open(file_path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as content:
+        # Extract title from first non-blank line (remove # prefix)
+        title = _first_line(content).decode('utf-8').strip().lstrip('#').strip() or file_path.stem
 
-    # Split content into sections by **User - --** and **Assistant - --**
-    sections = re.split(r'\*\*(User|Assistant) - --\*\*', content)
-
-    # Remove title section and empty sections, but keep the first empty entry which might contain the title
-    sections = [s.strip() for s in sections[1:] if s.strip()]  # Skip the title section
+        sections = list(_iter_sections(content))
 
     print(f"Found {len(sections)} sections after splitting")
 
@@ -42,33 +87,33 @@ def parse_markdown_file(file_path: Path) -> Conversation:
     current_user_prompt = None
     current_responses = []
 
-    i = 0
-    while i < len(sections):
-        if i % 2 == 0:  # Even indices are section types (User/Assistant)
-            section_type = sections[i]
-        else:  # Odd indices are section content
-            section_content = sections[i]
-
-            if section_type == "User":
-                # Save previous turn if we have one with exactly 4 responses
-                if current_user_prompt and len(current_responses) == 4:
-                    turns.append(Turn(current_user_prompt, current_responses))
-                    print(f"Added turn with {len(current_responses)} responses")
-
-                # Start new turn
-                current_user_prompt = section_content.strip()
-                current_responses = []
-                print(f"New user prompt: {current_user_prompt[:50]}...")
-
-            elif section_type == "Assistant" and current_user_prompt:
-                # Only collect responses if we have a prompt
-                current_responses.append(section_content.strip())
-                print(f"Added assistant response #{len(current_responses)}: {len(section_content)} chars")
-
-        i += 1
+    for section_type, section_content in sections:
+        section_content = section_content.strip()
+        if not section_content:
+            continue
+
+        if section_type == "User":
+            # Save previous turn, failing fast unless it has exactly 4 responses
+            if current_user_prompt:
+                if len(current_responses) != 4:
+                    raise ValueError(f"Turn with prompt {current_user_prompt[:40]!r} has {len(current_responses)} responses, expected 4")
+                turns.append(Turn(current_user_prompt, current_responses))
+                print(f"Added turn with {len(current_responses)} responses")
+
+            # Start new turn
+            current_user_prompt = section_content
+            current_responses = []
+            print(f"New user prompt: {current_user_prompt[:50]}...")
+
+        elif section_type == "Assistant" and current_user_prompt:
+            # Only collect responses if we have a prompt
+            current_responses.append(section_content)
+            print(f"Added assistant response #{len(current_responses)}: {len(section_content)} chars")
 
     # Don't forget the last turn
-    if current_user_prompt and len(current_responses) == 4:
+    if current_user_prompt:
+        if len(current_responses) != 4:
+            raise ValueError(f"Turn with prompt {current_user_prompt[:40]!r} has {len(current_responses)} responses, expected 4")
         turns.append(Turn(current_user_prompt, current_responses))
         print(f"Added final turn with {len(current_responses)} responses")
 
@@ -83,7 +128,11 @@ def main():
         return
 
     print("Testing markdown parser...")
-    conversation = parse_markdown_file(test_file)
+    try:
+        conversation = parse_markdown_file(test_file)
+    except ValueError as e:
+        print(f"❌ Could not parse {test_file}: {e}")
+        return
 
     print(f"Title: {conversation.title}")
     print(f"Number of turns: {len(conversation.turns)}")
@@ -100,9 +149,6 @@ def main():
         print(f"Prompt: {turn.user_prompt[:100]}...")
         print(f"Number of responses: {len(turn.responses)}")
 
-        if len(turn.responses) != 4:
-            print(f"WARNING: Expected 4 responses, got {len(turn.responses)}")
-
         for j, (model, response) in enumerate(zip(model_names, turn.responses), 1):
             print(f"  {model}: {len(response)} characters")
             print(f"    Preview: {response[:80]}...")
@@ -110,10 +156,11 @@ def main():
     print(f"\n✅ Parser test completed!")
     print(f"   Parsed {len(conversation.turns)} turns successfully")
 
-    if conversation.turns and len(conversation.turns[0].responses) == 4:
+    # parse_markdown_file rejects turns without 4 responses, so only an empty parse is left to report
+    if conversation.turns:
         print("   ✅ Response format is correct")
     else:
-        print("   ❌ Response format needs adjustment")
+        print("   ❌ No turns found, response format needs adjustment")
 
 if __name__ == "__main__":
     main()
\ No newline at end of file